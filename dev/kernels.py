@@ -0,0 +1,56 @@
+"""
+Numba kernels behind main.step_metrics().
+
+Kept out of main.py so that importing numba, and loading or compiling these
+kernels, only happens when step metrics are actually requested.
+"""
+import numpy as np
+from numba import njit, prange
+
+# Mean Earth radius used by the haversine distance, in meters.
+_EARTH_RADIUS_M = 6_371_008.8
+
+# Every fastmath flag except "nnan"/"ninf": the kernels write NaN turns on purpose.
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+
+@njit(fastmath=_FASTMATH, cache=True)
+def fill_step_metrics(
+    lon, lat, has_turn, bearing_before, bearing_after, distance, duration,
+    turn, speed, gap, start, stop,
+):
+    """
+    Fill turn/speed/gap for steps [start, stop) in place.
+    """
+    n = lon.size
+    for i in range(start, stop):
+        if has_turn[i]:
+            turn[i] = (bearing_after[i] - bearing_before[i] + 540.0) % 360.0 - 180.0
+        else:
+            turn[i] = np.nan
+        speed[i] = distance[i] / duration[i] if duration[i] > 0.0 else 0.0
+        if i + 1 < n:
+            lat1 = np.radians(lat[i])
+            lat2 = np.radians(lat[i + 1])
+            dlat = lat2 - lat1
+            dlon = np.radians(lon[i + 1] - lon[i])
+            a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+            gap[i] = 2.0 * _EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+        else:
+            gap[i] = 0.0
+
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def fill_step_metrics_parallel(
+    lon, lat, has_turn, bearing_before, bearing_after, distance, duration,
+    turn, speed, gap, chunk,
+):
+    """
+    Same as fill_step_metrics() over all steps, one chunk of steps per thread.
+    """
+    n = lon.size
+    for c in prange((n + chunk - 1) // chunk):
+        fill_step_metrics(
+            lon, lat, has_turn, bearing_before, bearing_after, distance, duration,
+            turn, speed, gap, c * chunk, min(n, (c + 1) * chunk),
+        )
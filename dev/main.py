@@ -1,62 +1,113 @@
-from typing import List, Optional
-import geopandas as gpd
-from shapely.geometry import Point
+import argparse
+import asyncio
+import atexit
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from itertools import islice
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 import httpx
-from pydantic import BaseModel, Field, field_validator, ConfigDict
+import msgspec
+import numpy as np
+from pyproj import Transformer
+
+# Built once: constructing a Transformer sets up a PROJ pipeline, which is far
+# more expensive than the transform itself.
+_TRANSFORMER_4326_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+
+_OSRM_BASE_URL = "https://routing.openstreetmap.de/routed-car/route/v1/driving"
+
+# Connection settings shared by the sync and async OSRM clients.
+_CLIENT_OPTIONS = dict(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=30.0,
+    headers={
+        "Accept": "*/*",
+        "Accept-Language": "en-US,en;q=0.9",
+        # Accept-Encoding is left to httpx: it offers gzip/deflate, plus br and
+        # zstd whenever it can decode them, and decompresses transparently.
+    },
+)
 
+# Shared across get_route() calls so repeated requests reuse a kept-alive
+# HTTP/2 connection instead of paying a TCP+TLS handshake each time.
+_CLIENT = httpx.Client(**_CLIENT_OPTIONS)
+atexit.register(_CLIENT.close)
 
-class Coordinate(BaseModel):
-    coordinates: List[float] = Field(..., description="Coordinates in [longitude, latitude] format")
+# Below this many points the thread pool costs more than it saves.
+_PARALLEL_TRANSFORM_THRESHOLD = 100_000
 
-    @property
-    def lat(self) -> float:
-        return self.coordinates[1]
+# Same idea for step_metrics(), counted in steps.
+_PARALLEL_METRICS_THRESHOLD = 100_000
+
+
+def reproject_3857(lons: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reproject arrays of EPSG:4326 lon/lat to EPSG:3857 x/y in meters.
+
+    Large inputs are split into chunks and transformed on a thread pool;
+    PROJ releases the GIL while transforming, so the chunks run in parallel.
+    """
+    workers = os.cpu_count() or 1
+    if lons.size <= _PARALLEL_TRANSFORM_THRESHOLD or workers == 1:
+        return _TRANSFORMER_4326_3857.transform(lons, lats)
+
+    lon_chunks = np.array_split(lons, workers)
+    lat_chunks = np.array_split(lats, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_TRANSFORMER_4326_3857.transform, lon_chunks, lat_chunks))
+    xs = np.concatenate([x for x, _ in results])
+    ys = np.concatenate([y for _, y in results])
+    return xs, ys
+
+
+class Coordinate(msgspec.Struct, array_like=True, frozen=True, gc=False):
+    """
+    A point in [longitude, latitude] order.
+
+    ``array_like`` makes msgspec decode the bare ``[lon, lat]`` lists OSRM
+    returns straight into this struct. Routes hold one of these per
+    intersection, so it is kept as small as possible: no ``__dict__`` and
+    no GC tracking (it only holds two floats), 32 bytes per instance.
+    """
+    lon: float
+    lat: float
 
     @property
-    def lon(self) -> float:
-        return self.coordinates[0]
+    def xy_3857(self) -> Tuple[float, float]:
+        """
+        This point in EPSG:3857 (Web Mercator) meters.
+        """
+        return _TRANSFORMER_4326_3857.transform(self.lon, self.lat)
 
     def to_3857(self) -> "Coordinate":
         """
         Reproject this point from EPSG:4326 to EPSG:3857 (Web Mercator)
         and return a new Coordinate holding the [x, y] in meters.
         """
-        # Create a GeoSeries with the single point in lon/lat
-        pt = Point(self.lon, self.lat)
-        geo = gpd.GeoSeries([pt], crs="EPSG:4326")
-        # Reproject
-        webmerc = geo.to_crs("EPSG:3857")
-        # Extract x, y
-        x, y = webmerc.geometry.iloc[0].x, webmerc.geometry.iloc[0].y
-        # Return a new Coordinate—in this context, coordinates=[x, y]
-        return Coordinate(coordinates=[x, y])
-
-
-class Lane(BaseModel):
+        x, y = self.xy_3857
+        # Return a new Coordinate—in this context, lon/lat hold x/y
+        return Coordinate(x, y)
+
+
+class Lane(msgspec.Struct):
     valid: bool
     indications: List[str]
 
 
-class Intersection(BaseModel):
-    out: Optional[int] = None
-    in_: Optional[int] = Field(None, alias="in")
+class Intersection(msgspec.Struct):
     entry: List[bool]
     bearings: List[int]
     location: Coordinate
+    out: Optional[int] = None
+    in_: Optional[int] = msgspec.field(default=None, name="in")
     lanes: Optional[List[Lane]] = None
 
-    model_config = ConfigDict(populate_by_name=True)
-
-    @field_validator("location", mode="before")
-    def _parse_location(cls, v):
-        # OSRM returns a bare [lon, lat] list
-        if isinstance(v, list):
-            return {"coordinates": v}
-        return v
 
-
-class Maneuver(BaseModel):
+class Maneuver(msgspec.Struct):
     bearing_after: int
     bearing_before: int
     location: Coordinate
@@ -64,14 +115,8 @@ class Maneuver(BaseModel):
     modifier: Optional[str] = None
     exit: Optional[int] = None
 
-    @field_validator("location", mode="before")
-    def _parse_location(cls, v):
-        if isinstance(v, list):
-            return {"coordinates": v}
-        return v
-
 
-class Step(BaseModel):
+class Step(msgspec.Struct):
     intersections: List[Intersection]
     driving_side: str
     geometry: str
@@ -83,11 +128,34 @@ class Step(BaseModel):
     distance: float
 
 
-class Leg(BaseModel):
+class Leg(msgspec.Struct):
     steps: List[Step]
 
 
-class Route(BaseModel):
+# OSRM sends bearing_before = 0 for "depart" and bearing_after = 0 for
+# "arrive", so these maneuvers carry no turn angle.
+_NO_TURN_MANEUVERS = frozenset({"depart", "arrive"})
+
+
+class RouteArrays(NamedTuple):
+    """
+    Structure-of-arrays view of a route's step coordinates.
+
+    Steps are numbered across all legs of the route, in order.
+    """
+    maneuver_lon: np.ndarray  # one entry per step
+    maneuver_lat: np.ndarray
+    has_turn: np.ndarray  # false for depart/arrive, whose bearings are placeholders
+    bearing_before: np.ndarray
+    bearing_after: np.ndarray
+    distance: np.ndarray
+    duration: np.ndarray
+    lon: np.ndarray  # one entry per intersection
+    lat: np.ndarray
+    step_idx: np.ndarray  # step each intersection belongs to
+
+
+class Route(msgspec.Struct, dict=True):
     legs: List[Leg]
     weight_name: str
     weight: float
@@ -95,70 +163,235 @@ class Route(BaseModel):
     distance: float
     summary: Optional[str] = ""
 
+    @cached_property
+    def coord_arrays(self) -> RouteArrays:
+        """
+        The route's maneuver and intersection coordinates as flat float64
+        arrays, built on first access with a single walk of the step tree.
+        """
+        steps = [step for leg in self.legs for step in leg.steps]
+        maneuver_lon = np.empty(len(steps), dtype=np.float64)
+        maneuver_lat = np.empty(len(steps), dtype=np.float64)
+        has_turn = np.empty(len(steps), dtype=np.bool_)
+        bearing_before = np.empty(len(steps), dtype=np.float64)
+        bearing_after = np.empty(len(steps), dtype=np.float64)
+        distance = np.empty(len(steps), dtype=np.float64)
+        duration = np.empty(len(steps), dtype=np.float64)
+
+        n = sum(len(step.intersections) for step in steps)
+        lon = np.empty(n, dtype=np.float64)
+        lat = np.empty(n, dtype=np.float64)
+        step_idx = np.empty(n, dtype=np.intp)
+
+        i = 0
+        for idx, step in enumerate(steps):
+            location = step.maneuver.location
+            maneuver_lon[idx] = location.lon
+            maneuver_lat[idx] = location.lat
+            has_turn[idx] = step.maneuver.type not in _NO_TURN_MANEUVERS
+            bearing_before[idx] = step.maneuver.bearing_before
+            bearing_after[idx] = step.maneuver.bearing_after
+            distance[idx] = step.distance
+            duration[idx] = step.duration
+            for intersection in step.intersections:
+                lon[i] = intersection.location.lon
+                lat[i] = intersection.location.lat
+                step_idx[i] = idx
+                i += 1
+
+        return RouteArrays(
+            maneuver_lon, maneuver_lat, has_turn, bearing_before, bearing_after, distance, duration,
+            lon, lat, step_idx,
+        )
+
+
+def step_metrics(arrays: RouteArrays) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-step turn angle, speed and straight-line gap of a route.
+
+    Takes a Route.coord_arrays view and returns three float64 arrays with one
+    entry per step:
 
-class Waypoint(BaseModel):
+    - the signed turn at the maneuver in degrees, in [-180, 180), positive
+      to the right. NaN for ``depart`` and ``arrive`` maneuvers, whose OSRM
+      bearing_before/bearing_after is a placeholder 0 rather than a real
+      heading;
+    - the average speed over the step in m/s (0 for zero-duration steps);
+    - the haversine distance in meters to the next maneuver (0 for the last).
+
+    The math runs in Numba kernels that are imported, and compiled or loaded
+    from the on-disk cache, on first call. Long routes are split across threads.
+    """
+    from kernels import fill_step_metrics, fill_step_metrics_parallel
+
+    n = arrays.maneuver_lon.size
+    turn = np.empty(n, dtype=np.float64)
+    speed = np.empty(n, dtype=np.float64)
+    gap = np.empty(n, dtype=np.float64)
+    columns = (
+        arrays.maneuver_lon, arrays.maneuver_lat, arrays.has_turn,
+        arrays.bearing_before, arrays.bearing_after, arrays.distance, arrays.duration,
+        turn, speed, gap,
+    )
+    workers = os.cpu_count() or 1
+    if n <= _PARALLEL_METRICS_THRESHOLD or workers == 1:
+        fill_step_metrics(*columns, 0, n)
+    else:
+        fill_step_metrics_parallel(*columns, -(-n // workers))
+    return turn, speed, gap
+
+
+class Waypoint(msgspec.Struct):
     hint: str
     location: Coordinate
     name: str
     distance: float
 
-    @field_validator("location", mode="before")
-    def _parse_location(cls, v):
-        if isinstance(v, list):
-            return {"coordinates": v}
-        return v
 
-
-class OSRMResponse(BaseModel):
+class OSRMResponse(msgspec.Struct):
     code: str
     routes: List[Route]
     waypoints: List[Waypoint]
 
 
-def get_route(
+# Decoders are reusable and skip per-call type lookup.
+_OSRM_DECODER = msgspec.json.Decoder(OSRMResponse)
+
+
+def _route_request(
     start_coordinate: Coordinate,
     end_coordinate: Coordinate,
-    *,
-    base_url: str = "https://routing.openstreetmap.de/routed-car/route/v1/driving"
-) -> OSRMResponse:
+    steps: bool,
+    base_url: str,
+) -> Tuple[str, Dict[str, str]]:
     """
-    Fetch a driving route between two points from the OSRM API and parse it.
+    Build the URL and query parameters of an OSRM route request.
+
+    The route overview geometry is never requested since nothing reads it.
     """
     coords = f"{start_coordinate.lon},{start_coordinate.lat};{end_coordinate.lon},{end_coordinate.lat}"
     params = {
-        "overview": "full",
+        "overview": "false",
         "geometries": "polyline",
-        "steps": "true",
-    }
-    headers = {
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.9",
+        "steps": "true" if steps else "false",
     }
+    return f"{base_url}/{coords}", params
+
+
+def get_route(
+    start_coordinate: Coordinate,
+    end_coordinate: Coordinate,
+    *,
+    steps: bool = True,
+    base_url: str = _OSRM_BASE_URL
+) -> OSRMResponse:
+    """
+    Fetch a driving route between two points from the OSRM API and parse it.
 
-    resp = httpx.get(f"{base_url}/{coords}", params=params, headers=headers)
+    Pass ``steps=False`` when the turn-by-turn steps aren't needed.
+    """
+    url, params = _route_request(start_coordinate, end_coordinate, steps, base_url)
+    resp = _CLIENT.get(url, params=params)
+    resp.raise_for_status()
+    # Parse and validate the raw bytes in one pass, without building an intermediate dict
+    return _OSRM_DECODER.decode(resp.content)
+
+
+async def get_route_async(
+    client: httpx.AsyncClient,
+    start_coordinate: Coordinate,
+    end_coordinate: Coordinate,
+    *,
+    steps: bool = True,
+    base_url: str = _OSRM_BASE_URL
+) -> OSRMResponse:
+    """
+    Async counterpart of get_route(), issued through the given client.
+    """
+    url, params = _route_request(start_coordinate, end_coordinate, steps, base_url)
+    resp = await client.get(url, params=params)
     resp.raise_for_status()
-    data = resp.json()
-    return OSRMResponse.model_validate(data)
+    return _OSRM_DECODER.decode(resp.content)
+
+
+def get_routes(
+    pairs: Iterable[Tuple[Coordinate, Coordinate]],
+    *,
+    steps: bool = True,
+    base_url: str = _OSRM_BASE_URL
+) -> List[OSRMResponse]:
+    """
+    Fetch the routes for many (start, end) pairs concurrently, in input order.
+
+    All requests are multiplexed over one HTTP/2 connection. The async client
+    lives only for the batch, since its pool is bound to the event loop that
+    asyncio.run() creates and tears down.
+
+    This is the entry point for synchronous code only. From async code (or
+    Jupyter), where an event loop is already running, gather get_route_async()
+    calls over your own httpx.AsyncClient instead; calling this raises
+    RuntimeError.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError(
+            "get_routes() cannot run inside a running event loop; "
+            "await get_route_async() with an httpx.AsyncClient instead"
+        )
+
+    async def fetch_all() -> List[OSRMResponse]:
+        async with httpx.AsyncClient(**_CLIENT_OPTIONS) as client:
+            return await asyncio.gather(*(
+                get_route_async(client, start, end, steps=steps, base_url=base_url)
+                for start, end in pairs
+            ))
+
+    return asyncio.run(fetch_all())
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Print the maneuver locations of an OSRM driving route.")
+    parser.add_argument(
+        "--project",
+        action="store_true",
+        help="reproject step locations to EPSG:3857 meters instead of printing raw [lon, lat]",
+    )
+    args = parser.parse_args()
+
     start_lat, start_lon = 4.718556, -74.044338
     end_lat, end_lon = 4.9112815, -73.9422946
 
-    start = Coordinate(coordinates=[start_lon, start_lat])
-    end = Coordinate(coordinates=[end_lon, end_lat])
+    start = Coordinate(start_lon, start_lat)
+    end = Coordinate(end_lon, end_lat)
 
     resp = get_route(start, end)
     if resp.code.lower() != "ok":
         print(f"-> API returned error code: {resp.code}")
         return
 
+    arrays = [route.coord_arrays for route in resp.routes]
+    xs = np.concatenate([a.maneuver_lon for a in arrays])
+    ys = np.concatenate([a.maneuver_lat for a in arrays])
+    if args.project:
+        # Reproject every maneuver location in a single PROJ call instead of one per step
+        xs, ys = reproject_3857(xs, ys)
+        step_fmt = "Step location: [{:.2f}, {:.2f}]".format
+    else:
+        step_fmt = "Step location: [{:.6f}, {:.6f}]".format
+
+    # Build the whole report first and write it once, rather than a print() per step
+    points = zip(xs.tolist(), ys.tolist())
+    lines: List[str] = []
     for route_idx, route in enumerate(resp.routes, start=1):
-        print(f"\nRoute {route_idx}: summary='{route.summary}'  🛣  {route.distance:.0f} m, {route.duration:.0f} s")
+        lines.append(f"\nRoute {route_idx}: summary='{route.summary}'  🛣  {route.distance:.0f} m, {route.duration:.0f} s")
         for leg_idx, leg in enumerate(route.legs, start=1):
-            print(f"  Leg {leg_idx}:")
-            for step_idx, step in enumerate(leg.steps, start=1):
-                print(f"Step location: {step.maneuver.location.to_3857().coordinates}")
+            lines.append(f"  Leg {leg_idx}:")
+            lines.extend(step_fmt(x, y) for x, y in islice(points, len(leg.steps)))
+    lines.append("")
+    sys.stdout.write("\n".join(lines))
 
 if __name__ == "__main__":
     main()